@@ -1,182 +1,784 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Awaitable, Callable, Final, FrozenSet, List, Literal, Optional, Set, Tuple, TYPE_CHECKING
 import os
-import json
-from anthropic import Anthropic
-from pydantic import BaseModel, Field
-from twilio.rest import Client
+import io
+import hashlib
+import time
+import uuid
+import asyncio
+import logging
+import orjson
+from anthropic import APIError, AsyncAnthropic, DefaultAsyncHttpxClient
+from typing_extensions import Annotated, TypedDict
+from pydantic import Field, TypeAdapter, ValidationError
 from dotenv import load_dotenv
-import traceback
+from collections import Counter, OrderedDict, defaultdict
+from functools import lru_cache
 from datetime import datetime, timedelta
 
+if TYPE_CHECKING:
+    from twilio.rest import Client
+
 # Load environment variables
 load_dotenv()
 
-# -------------------- Pydantic Schemas --------------------
+logger = logging.getLogger(__name__)
+
+class TriageError(Exception):
+    """Raised when a Claude triage call fails or returns unusable data."""
+
+class _TruncatedResponse(ValueError):
+    """Raised when Claude hits max_tokens before finishing the tool input."""
+
+# Failures expected from a Claude call; anything else is a bug and propagates
+_TRIAGE_ERRORS = (APIError, ValidationError, ValueError)
+
+# -------------------- Schemas --------------------
+
+# The data is passed around as plain dicts, so the schemas are TypedDicts
+# validated by pydantic-core through TypeAdapters. Validation produces the
+# dicts directly, with no model instance to build and dump.
+
+class Symptom(TypedDict):
+    description: Annotated[str, Field(description="Description of the symptom")]
+    severity: Annotated[str, Field(description="Severity level of the symptom (mild, moderate, severe)")]
+
+class VitalSigns(TypedDict):
+    blood_pressure: Annotated[Dict[str, int], Field(description="Blood pressure readings (systolic and diastolic)")]
+    heart_rate: Annotated[int, Field(description="Heart rate in beats per minute")]
+    temperature: Annotated[Dict[str, Any], Field(description="Body temperature with value and unit")]
+    oxygen_saturation: Annotated[int, Field(description="Oxygen saturation percentage")]
+
+class StructuredData(TypedDict):
+    symptoms: Annotated[List[Symptom], Field(description="List of symptoms with their severity")]
+    vital_signs: Annotated[VitalSigns, Field(description="Vital signs measurements")]
+    medical_history: Annotated[List[str], Field(description="List of relevant medical history items")]
+
+class RiskAssessment(TypedDict):
+    risk_level: Annotated[Literal["LOW", "MODERATE", "HIGH"], Field(description="Risk level (LOW, MODERATE, HIGH)")]
+    explanation: Annotated[str, Field(description="Detailed explanation of the risk assessment")]
+
+class TriageResult(TypedDict):
+    structured_data: Annotated[StructuredData, Field(description="Structured medical data extracted from the input")]
+    risk_assessment: Annotated[RiskAssessment, Field(description="Risk assessment for the extracted data")]
+
+class StructuredDataBatch(TypedDict):
+    patients: Annotated[List[StructuredData], Field(description="Structured medical data for each patient, in input order")]
+
+STRUCTURED_DATA_ADAPTER = TypeAdapter(StructuredData)
+STRUCTURED_DATA_BATCH_ADAPTER = TypeAdapter(StructuredDataBatch)
+RISK_ASSESSMENT_ADAPTER = TypeAdapter(RiskAssessment)
+TRIAGE_RESULT_ADAPTER = TypeAdapter(TriageResult)
+
+# -------------------- Prompts --------------------
+
+# System prompts are module-level constants so the cached prefix is
+# byte-identical across calls; any change here invalidates the prompt cache.
+SYSTEM_PROMPT_EXTRACT: Final[str] = """You are a medical triage assistant. Extract structured medical information from the input text.
+Focus on identifying symptoms, their severity, vital signs, and relevant medical history.
+Format the output as a JSON object with the following structure:
+{
+    "symptoms": [
+        {
+            "description": "string",
+            "severity": "mild|moderate|severe"
+        }
+    ],
+    "vital_signs": {
+        "blood_pressure": {
+            "systolic": number,
+            "diastolic": number
+        },
+        "heart_rate": number,
+        "temperature": {
+            "value": number,
+            "unit": "C|F"
+        },
+        "oxygen_saturation": number
+    },
+    "medical_history": ["string"]
+}"""
+
+SYSTEM_PROMPT_RISK: Final[str] = """You are a medical risk assessment expert. Analyze the provided medical data and determine the risk level.
+Consider symptoms, vital signs, and medical history.
+Provide a risk level (LOW, MODERATE, HIGH) and a detailed explanation.
+Format your response as a JSON object with 'risk_level' and 'explanation' fields.
+For neurological symptoms (headache, weakness, speech problems) with high blood pressure, always return HIGH risk.
+For chest pain with shortness of breath, always return HIGH risk."""
+
+# Single-call triage: extraction and risk assessment in one response.
+SYSTEM_PROMPT_TRIAGE: Final[str] = (
+    SYSTEM_PROMPT_EXTRACT
+    + "\n\n"
+    + SYSTEM_PROMPT_RISK
+    + "\n\n"
+    + """Return both results together: the extracted medical data as "structured_data"
+and the risk level and explanation as "risk_assessment"."""
+)
+
+_ANALYZE_PREFIX: Final[str] = "Analyze this medical data: "
+_BATCH_PREFIX: Final[str] = "Process each patient below and return one entry per patient, in the same order:\n\n"
+
+# Each patient gets the single-extraction budget; groups of this size stay
+# under the fallback model's 4096-token output limit
+EXTRACT_TOKENS_PER_PATIENT = 400
+EXTRACT_BATCH_SIZE = 8
+
+# Mark the static system prompts as cacheable so repeat calls read the
+# prefix from Anthropic's prompt cache instead of reprocessing it.
+_EXTRACT_SYSTEM_BLOCKS = [
+    {"type": "text", "text": SYSTEM_PROMPT_EXTRACT, "cache_control": {"type": "ephemeral"}}
+]
+_RISK_SYSTEM_BLOCKS = [
+    {"type": "text", "text": SYSTEM_PROMPT_RISK, "cache_control": {"type": "ephemeral"}}
+]
+_TRIAGE_SYSTEM_BLOCKS = [
+    {"type": "text", "text": SYSTEM_PROMPT_TRIAGE, "cache_control": {"type": "ephemeral"}}
+]
+
+# Forced tool use makes Claude return schema-shaped input instead of free text.
+_EXTRACT_TOOL = {
+    "name": "record_structured_data",
+    "description": "Record the structured medical data extracted from the input.",
+    "input_schema": STRUCTURED_DATA_ADAPTER.json_schema(),
+}
+_EXTRACT_BATCH_TOOL = {
+    "name": "record_structured_data_batch",
+    "description": "Record the structured medical data extracted for every patient in the input.",
+    "input_schema": STRUCTURED_DATA_BATCH_ADAPTER.json_schema(),
+}
+_RISK_TOOL = {
+    "name": "record_risk_assessment",
+    "description": "Record the risk assessment for the medical data.",
+    "input_schema": RISK_ASSESSMENT_ADAPTER.json_schema(),
+}
+_TRIAGE_TOOL = {
+    "name": "record_triage",
+    "description": "Record the structured medical data and its risk assessment.",
+    "input_schema": TRIAGE_RESULT_ADAPTER.json_schema(),
+}
+
+def _tool_input(response) -> Dict[str, Any]:
+    """Return the input of the first tool_use block in a Claude response.
+
+    If Claude answered in text instead, the first JSON object in the text is
+    used, so fenced or prose-wrapped JSON doesn't cost another call.
+    """
+    for block in response.content:
+        if block.type == "tool_use":
+            return block.input
+    for block in response.content:
+        if block.type == "text":
+            raw = _find_json_object(block.text)
+            if raw is not None:
+                try:
+                    return orjson.loads(raw)
+                except orjson.JSONDecodeError:
+                    pass
+    return {}
+
+def _find_json_object(text: str) -> Optional[str]:
+    """Return the first balanced {...} span in text, skipping braces inside strings."""
+    start = text.find("{")
+    if start == -1:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+# -------------------- Response Cache --------------------
+
+# Exact-match cache of validated Claude results, keyed by call type and a
+# hash of the normalized input. Results are stored as JSON bytes that already passed
+# validation, so a hit only decodes them into fresh dicts; callers never share
+# state, and side effects (doctor notification) still run.
+_RESPONSE_CACHE_SIZE = 2048
+_response_cache: "OrderedDict[str, bytes]" = OrderedDict()
+
+def _cache_key(kind: str, text: str) -> str:
+    """Key a text input by the SHA-256 of its whitespace-normalized form."""
+    return _hash_key(kind, " ".join(text.split()).encode())
+
+def _data_cache_key(kind: str, data: Dict[str, Any]) -> str:
+    """Key a dict input by the SHA-256 of its canonical (sorted-key) JSON."""
+    return _hash_key(kind, orjson.dumps(data, option=orjson.OPT_SORT_KEYS))
+
+def _hash_key(kind: str, payload: bytes) -> str:
+    # Hashing keeps keys small even for whole uploaded documents
+    return f"{kind}:{hashlib.sha256(payload).hexdigest()}"
+
+def _cache_get(key: str) -> Optional[bytes]:
+    data = _response_cache.get(key)
+    if data is not None:
+        _response_cache.move_to_end(key)
+    return data
+
+def _cache_put(key: str, data: Dict[str, Any]) -> None:
+    _response_cache[key] = orjson.dumps(data)
+    _response_cache.move_to_end(key)
+    if len(_response_cache) > _RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
+# -------------------- Shared Clients --------------------
+
+# One pooled HTTP/2 transport for every Claude call in the process, so requests
+# reuse warm TCP/TLS connections instead of each client opening its own pool.
+# DefaultAsyncHttpxClient keeps the SDK's keep-alive and connection limits and
+# matches the HTTP library the installed SDK is built on.
+_HTTP_CLIENT = DefaultAsyncHttpxClient(http2=True, timeout=60)
+
+@lru_cache(maxsize=None)
+def _anthropic_client(api_key: str) -> AsyncAnthropic:
+    return AsyncAnthropic(api_key=api_key, http_client=_HTTP_CLIENT)
 
-class Symptom(BaseModel):
-    description: str = Field(description="Description of the symptom")
-    severity: str = Field(description="Severity level of the symptom (mild, moderate, severe)")
+@lru_cache(maxsize=None)
+def _twilio_client(account_sid: str, auth_token: str) -> "Client":
+    # Imported here so the Twilio SDK only loads once an alert is sent
+    from twilio.rest import Client
 
-class VitalSigns(BaseModel):
-    blood_pressure: Dict[str, int] = Field(description="Blood pressure readings (systolic and diastolic)")
-    heart_rate: int = Field(description="Heart rate in beats per minute")
-    temperature: Dict[str, Any] = Field(description="Body temperature with value and unit")
-    oxygen_saturation: int = Field(description="Oxygen saturation percentage")
+    # Twilio's default HTTP client keeps a pooled requests.Session per client
+    return Client(account_sid, auth_token)
 
-class StructuredData(BaseModel):
-    symptoms: List[Symptom] = Field(description="List of symptoms with their severity")
-    vital_signs: VitalSigns = Field(description="Vital signs measurements")
-    medical_history: List[str] = Field(description="List of relevant medical history items")
+# -------------------- Risk Rules --------------------
 
-class RiskAssessment(BaseModel):
-    risk_level: str = Field(description="Risk level (LOW, MODERATE, HIGH)")
-    explanation: str = Field(description="Detailed explanation of the risk assessment")
+# The fixed HIGH-risk rules from SYSTEM_PROMPT_RISK, checked before calling
+# Claude. A rule only fires when a symptom is exactly one of these terms, so
+# qualified or negated descriptions ("denies chest pain", "muscle weakness
+# after gym") still go to Claude.
+CHEST_PAIN_TERMS = frozenset({"chest pain"})
+SHORTNESS_OF_BREATH_TERMS = frozenset({"shortness of breath"})
+NEURO_SYMPTOM_TERMS = frozenset({"headache", "weakness", "speech problems", "slurred speech"})
+HIGH_SYSTOLIC_BP = 160
+
+def _symptom_terms(structured_data: Dict[str, Any]) -> Optional[FrozenSet[str]]:
+    """Return the normalized symptom descriptions, or None if the symptoms aren't shaped as expected."""
+    symptoms = structured_data.get("symptoms")
+    if not isinstance(symptoms, list):
+        return None
+    terms = set()
+    for symptom in symptoms:
+        description = symptom.get("description") if isinstance(symptom, dict) else None
+        if not isinstance(description, str):
+            return None
+        terms.add(" ".join(description.lower().split()).rstrip("."))
+    return frozenset(terms)
+
+def _rule_based_high_risk(structured_data: Dict[str, Any]) -> Optional[RiskAssessment]:
+    """Return a HIGH risk assessment if a fixed rule matches, otherwise None."""
+    terms = _symptom_terms(structured_data)
+    if terms is None:
+        return None
+
+    if terms & CHEST_PAIN_TERMS and terms & SHORTNESS_OF_BREATH_TERMS:
+        return {
+            "risk_level": "HIGH",
+            "explanation": "Chest pain with shortness of breath requires immediate evaluation."
+        }
+
+    vital_signs = structured_data.get("vital_signs")
+    blood_pressure = vital_signs.get("blood_pressure") if isinstance(vital_signs, dict) else None
+    systolic = blood_pressure.get("systolic") if isinstance(blood_pressure, dict) else None
+    if (
+        terms & NEURO_SYMPTOM_TERMS
+        and isinstance(systolic, (int, float))
+        and not isinstance(systolic, bool)
+        and systolic >= HIGH_SYSTOLIC_BP
+    ):
+        return {
+            "risk_level": "HIGH",
+            "explanation": f"Neurological symptoms with high blood pressure ({systolic} mmHg systolic) "
+                           "require immediate evaluation."
+        }
+    return None
+
+# -------------------- SMS Formatting --------------------
+
+# Keep the body under Twilio's 1600-character limit
+SMS_BODY_LIMIT = 1500
+_SMS_TRUNCATED = "\n... (truncated)"
+
+def _format_sms(structured_data: Dict[str, Any], risk_assessment: Dict[str, Any]) -> str:
+    """Build the doctor alert, stopping once SMS_BODY_LIMIT characters are written.
+
+    Sections are rendered lazily, so anything past the limit is never serialized.
+    """
+    sections = (
+        lambda: (
+            "🚨 HIGH RISK MEDICAL CASE 🚨\n\n"
+            f"Risk Level: {risk_assessment['risk_level']}\n"
+            f"Explanation: {risk_assessment['explanation']}\n\n"
+            "Patient Data:\n"
+        ),
+        lambda: f"Symptoms: {orjson.dumps([s['description'] for s in structured_data['symptoms']]).decode()}\n",
+        lambda: f"Vital Signs: {orjson.dumps(structured_data['vital_signs']).decode()}\n",
+        lambda: "Medical History:\n" + "\n".join(structured_data["medical_history"]),
+    )
+
+    buffer = io.StringIO()
+    remaining = SMS_BODY_LIMIT
+    for render in sections:
+        text = render()
+        if len(text) > remaining:
+            buffer.write(text[:remaining])
+            buffer.write(_SMS_TRUNCATED)
+            break
+        buffer.write(text)
+        remaining -= len(text)
+    return buffer.getvalue()
+
+# Strong references to in-flight notification tasks; the event loop only keeps
+# weak ones, so unreferenced tasks could be garbage collected mid-send.
+_background_tasks: Set["asyncio.Task[None]"] = set()
+
+def _on_notification_done(task: "asyncio.Task[None]") -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Doctor notification failed", exc_info=task.exception())
+
+def _notify_in_background(coro: Awaitable[None]) -> None:
+    """Dispatch a notification without making the caller wait for it."""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_notification_done)
+
+# A second alert within SMS_BURST_SECONDS starts a batch that stays open for
+# SMS_BATCH_WINDOW_SECONDS; Twilio accepts bodies up to 1600 characters
+SMS_BURST_SECONDS = 0.05
+SMS_BATCH_WINDOW_SECONDS = 0.5
+SMS_BATCH_LIMIT = 1600
+_SMS_SEPARATOR = "\n\n----------\n\n"
+
+def _merge_sms(batch: List[Tuple[str, str]]) -> List[Tuple[List[str], str]]:
+    """Pack queued (key, message) alerts into as few SMS bodies as fit the limit."""
+    merged: List[Tuple[List[str], str]] = []
+    for key, message in batch:
+        if merged and len(merged[-1][1]) + len(_SMS_SEPARATOR) + len(message) <= SMS_BATCH_LIMIT:
+            keys, body = merged[-1]
+            merged[-1] = (keys + [key], body + _SMS_SEPARATOR + message)
+        else:
+            merged.append(([key], message))
+    return merged
+
+# A repeat of the same request within this window is treated as a retry and dropped
+NOTIFICATION_DEDUPE_SECONDS = 600
+_recent_notifications: "OrderedDict[str, float]" = OrderedDict()
+
+def _notification_key(input_key: str, idempotency_key: Optional[str]) -> str:
+    """Key a doctor alert by the request that raised it, not by the rendered message.
+
+    Without an idempotency key each call is its own request, so it always alerts.
+    """
+    request_id = idempotency_key if idempotency_key is not None else uuid.uuid4().hex
+    return _hash_key("sms", f"{request_id}\n{input_key}".encode())
+
+def _claim_notification(key: str) -> bool:
+    """Return True if this alert hasn't been sent recently, and mark it as sent."""
+    now = time.monotonic()
+    while _recent_notifications and next(iter(_recent_notifications.values())) < now - NOTIFICATION_DEDUPE_SECONDS:
+        _recent_notifications.popitem(last=False)
+    if key in _recent_notifications:
+        return False
+    _recent_notifications[key] = now
+    return True
 
 # -------------------- Core Integration Class --------------------
 
+# Extraction is a schema-filling task, so a fast model handles the common case
+# and the slower, stronger model is only used when its output fails validation.
+DEFAULT_MODEL = "claude-3-5-haiku-20241022"
+FALLBACK_MODEL = "claude-3-opus-20240229"
+
+# A reply cut off at max_tokens is retried with double the budget, at least
+# the 1000 tokens these calls used to get and within the fallback model's
+# 4096-token output limit
+RETRY_MIN_TOKENS = 1000
+FALLBACK_MAX_TOKENS = 4096
+
+REQUIRED_VARS = (
+    "ANTHROPIC_API_KEY",
+    "TWILIO_ACCOUNT_SID",
+    "TWILIO_AUTH_TOKEN",
+    "DOCTOR_PHONE_NUMBER",
+    "TWILIO_PHONE_NUMBER",
+)
+
+@lru_cache(maxsize=None)
+def _load_config() -> Dict[str, str]:
+    """Read the required environment variables once per process."""
+    env = os.environ
+    missing = [var for var in REQUIRED_VARS if not env.get(var)]
+    if missing:
+        raise EnvironmentError(f"Missing environment variables: {', '.join(missing)}")
+    return {var: env[var] for var in REQUIRED_VARS}
+
 class AgentKitIntegration:
-    def __init__(self):
+    def __init__(self, model: str = DEFAULT_MODEL, fallback_model: str = FALLBACK_MODEL):
+        self.model = model
+        self.fallback_model = fallback_model
+
         # Check for required environment variables
-        required_vars = [
-            "ANTHROPIC_API_KEY",
-            "TWILIO_ACCOUNT_SID",
-            "TWILIO_AUTH_TOKEN",
-            "DOCTOR_PHONE_NUMBER",
-            "TWILIO_PHONE_NUMBER"
-        ]
-        for var in required_vars:
-            if not os.getenv(var):
-                raise EnvironmentError(f"Missing environment variable: {var}")
+        env = _load_config()
 
-        # Initialize Anthropic client
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        # Reuse the process-wide Anthropic client
+        self.client = _anthropic_client(env["ANTHROPIC_API_KEY"])
         
-        # Initialize Twilio client
-        self.twilio_client = Client(
-            os.getenv("TWILIO_ACCOUNT_SID"),
-            os.getenv("TWILIO_AUTH_TOKEN")
-        )
-        self.doctor_phone = os.getenv("DOCTOR_PHONE_NUMBER")
-        self.twilio_phone = os.getenv("TWILIO_PHONE_NUMBER")
+        # The process-wide Twilio client is created on the first SMS
+        self.twilio_client: Optional["Client"] = None
+        self._twilio_credentials = (env["TWILIO_ACCOUNT_SID"], env["TWILIO_AUTH_TOKEN"])
+        self.doctor_phone = env["DOCTOR_PHONE_NUMBER"]
+        self.twilio_phone = env["TWILIO_PHONE_NUMBER"]
+
+        # Alerts are queued and sent by a single worker, started on first use
+        self._sms_queue: Optional["asyncio.Queue[Tuple[str, str]]"] = None
+        self._sms_worker: Optional["asyncio.Task[None]"] = None
+
+    async def warm_up(self) -> None:
+        """Open the pooled connection to Anthropic before the first request needs it."""
+        await self.client.models.list(limit=1)
+
+    async def triage(
+        self,
+        text: str,
+        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+        idempotency_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Extract structured data and assess risk from text input in a single call.
+
+        Input that is already structured should go through analyze_risk instead.
+        on_partial receives the partially parsed result while Claude is still
+        generating; it is not called on a cache hit. A retry carrying the same
+        idempotency_key and text doesn't alert the doctor again.
+        """
+        try:
+            cache_key = _cache_key("triage", text)
+            cached = _cache_get(cache_key)
+            if cached is None:
+                result = await self._run_tool(
+                    TRIAGE_RESULT_ADAPTER, _TRIAGE_SYSTEM_BLOCKS, _TRIAGE_TOOL, text, max_tokens=800,
+                    on_partial=on_partial
+                )
+                _cache_put(cache_key, result)
+            else:
+                result = orjson.loads(cached)
+
+            # If risk is HIGH, notify doctor via SMS without delaying the response
+            if result["risk_assessment"]["risk_level"] == "HIGH":
+                _notify_in_background(self._notify_doctor(
+                    _notification_key(cache_key, idempotency_key), result["structured_data"], result["risk_assessment"]
+                ))
 
-    def extract_structured_data(self, text: str) -> Dict[str, Any]:
+            return result
+        except _TRIAGE_ERRORS as e:
+            raise TriageError(f"Error in triage: {e}") from e
+
+    async def extract_structured_data(self, text: str) -> Dict[str, Any]:
         """Extract structured medical data from text input."""
         try:
-            # Create the prompt
-            system_prompt = """You are a medical triage assistant. Extract structured medical information from the input text.
-            Focus on identifying symptoms, their severity, vital signs, and relevant medical history.
-            Format the output as a JSON object with the following structure:
-            {
-                "symptoms": [
-                    {
-                        "description": "string",
-                        "severity": "mild|moderate|severe"
-                    }
-                ],
-                "vital_signs": {
-                    "blood_pressure": {
-                        "systolic": number,
-                        "diastolic": number
-                    },
-                    "heart_rate": number,
-                    "temperature": {
-                        "value": number,
-                        "unit": "C|F"
-                    },
-                    "oxygen_saturation": number
-                },
-                "medical_history": ["string"]
-            }"""
-
-            # Get response from Claude
-            response = self.client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
-                temperature=0,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": text}
-                ]
-            )
-            
-            # Safely extract and parse the response
-            raw = response.content[0].text if response.content else "{}"
-            structured_data = StructuredData.parse_raw(raw).model_dump()
-            return structured_data
-        except Exception as e:
-            raise Exception(f"Error extracting structured data: {str(e)}")
+            cache_key = _cache_key("extract", text)
+            cached = _cache_get(cache_key)
+            if cached is None:
+                structured_data = await self._run_tool(
+                    STRUCTURED_DATA_ADAPTER, _EXTRACT_SYSTEM_BLOCKS, _EXTRACT_TOOL, text,
+                    max_tokens=EXTRACT_TOKENS_PER_PATIENT
+                )
+                _cache_put(cache_key, structured_data)
+                return structured_data
+            return orjson.loads(cached)
+        except _TRIAGE_ERRORS as e:
+            raise TriageError(f"Error extracting structured data: {e}") from e
 
-    def analyze_risk(self, structured_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Analyze risk level based on structured data."""
+    async def extract_structured_data_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Extract structured medical data for several patients in batched calls.
+
+        Inputs already in the response cache are served from it; the rest are
+        sent to Claude in groups of up to EXTRACT_BATCH_SIZE, one call per group.
+        """
         try:
-            system_prompt = """You are a medical risk assessment expert. Analyze the provided medical data and determine the risk level.
-            Consider symptoms, vital signs, and medical history.
-            Provide a risk level (LOW, MODERATE, HIGH) and a detailed explanation.
-            Format your response as a JSON object with 'risk_level' and 'explanation' fields.
-            For neurological symptoms (headache, weakness, speech problems) with high blood pressure, always return HIGH risk.
-            For chest pain with shortness of breath, always return HIGH risk."""
-
-            # Get response from Claude
-            response = self.client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
-                temperature=0,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": f"Analyze this medical data: {json.dumps(structured_data, indent=2)}"}
-                ]
-            )
-            
-            # Safely extract and parse the response
-            raw = response.content[0].text if response.content else "{}"
-            print("Raw risk assessment response:", raw)  # Debug log
-            risk_assessment = RiskAssessment.parse_raw(raw).model_dump()
-            print("Parsed risk assessment:", risk_assessment)  # Debug log
+            cache_keys = [_cache_key("extract", text) for text in texts]
+            results: List[Optional[Dict[str, Any]]] = []
+            pending: List[int] = []
+            for i, cache_key in enumerate(cache_keys):
+                cached = _cache_get(cache_key)
+                results.append(orjson.loads(cached) if cached is not None else None)
+                if cached is None:
+                    pending.append(i)
+
+            groups = [pending[n:n + EXTRACT_BATCH_SIZE] for n in range(0, len(pending), EXTRACT_BATCH_SIZE)]
+            batches = await asyncio.gather(*(self._extract_group([texts[i] for i in group]) for group in groups))
+            for group, patients in zip(groups, batches):
+                for i, structured_data in zip(group, patients):
+                    _cache_put(cache_keys[i], structured_data)
+                    results[i] = structured_data
+
+            return results
+        except _TRIAGE_ERRORS as e:
+            raise TriageError(f"Error extracting structured data batch: {e}") from e
+
+    async def _extract_group(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Extract structured data for up to EXTRACT_BATCH_SIZE patients with one call."""
+        content = _BATCH_PREFIX + "\n---\n".join(
+            f"<patient {n}>\n{text}\n</patient {n}>" for n, text in enumerate(texts)
+        )
+        batch = await self._run_tool(
+            STRUCTURED_DATA_BATCH_ADAPTER,
+            _EXTRACT_SYSTEM_BLOCKS,
+            _EXTRACT_BATCH_TOOL,
+            content,
+            max_tokens=EXTRACT_TOKENS_PER_PATIENT * len(texts),
+        )
+        patients = batch["patients"]
+        if len(patients) != len(texts):
+            raise ValueError(f"Expected {len(texts)} patients, got {len(patients)}")
+        return patients
+
+    async def analyze_risk(
+        self, structured_data: Dict[str, Any], idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Analyze risk level based on structured data.
+
+        A retry carrying the same idempotency_key and data doesn't alert the doctor again.
+        """
+        try:
+            cache_key = _data_cache_key("risk", structured_data)
+            # Cases covered by a fixed rule don't need a Claude call
+            risk_assessment = _rule_based_high_risk(structured_data)
+            if risk_assessment is None:
+                cached = _cache_get(cache_key)
+                if cached is None:
+                    content = _ANALYZE_PREFIX + orjson.dumps(structured_data, option=orjson.OPT_INDENT_2).decode()
+                    risk_assessment = await self._run_tool(
+                        RISK_ASSESSMENT_ADAPTER, _RISK_SYSTEM_BLOCKS, _RISK_TOOL, content, max_tokens=300
+                    )
+                    _cache_put(cache_key, risk_assessment)
+                else:
+                    risk_assessment = orjson.loads(cached)
+            logger.debug("Risk assessment response: %s", risk_assessment)
             
-            # If risk is HIGH, notify doctor via SMS
+            # If risk is HIGH, notify doctor via SMS without delaying the response
             if risk_assessment["risk_level"] == "HIGH":
-                self._notify_doctor(structured_data, risk_assessment)
+                _notify_in_background(self._notify_doctor(
+                    _notification_key(cache_key, idempotency_key), structured_data, risk_assessment
+                ))
             
             return risk_assessment
-        except Exception as e:
-            print(f"Error in analyze_risk: {str(e)}")  # Debug log
-            traceback.print_exc()  # Print full traceback
-            raise Exception(f"Error analyzing risk: {str(e)}")
+        except _TRIAGE_ERRORS as e:
+            logger.exception("analyze_risk failed")
+            raise TriageError(f"Error analyzing risk: {e}") from e
 
-    def _notify_doctor(self, structured_data: Dict[str, Any], risk_assessment: Dict[str, Any]) -> None:
-        """Send SMS notification to doctor for high-risk cases."""
+    async def _run_tool(
+        self,
+        schema: TypeAdapter,
+        system: List[Dict[str, Any]],
+        tool: Dict[str, Any],
+        content: str,
+        max_tokens: int,
+        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Run a tool call on the fast model, retrying on the fallback model if it is cut off or does not validate."""
         try:
-            # Format the message
-            message = (
-                "🚨 HIGH RISK MEDICAL CASE 🚨\n\n"
-                f"Risk Level: {risk_assessment['risk_level']}\n"
-                f"Explanation: {risk_assessment['explanation']}\n\n"
-                "Patient Data:\n"
-                f"Symptoms: {json.dumps([s['description'] for s in structured_data['symptoms']], indent=2)}\n"
-                f"Vital Signs: {json.dumps(structured_data['vital_signs'], indent=2)}\n"
-                f"Medical History: {json.dumps(structured_data['medical_history'], indent=2)}"
-            )
-            
-            # Truncate message if it exceeds Twilio's limit (1600 chars)
-            if len(message) > 1500:
-                message = message[:1500] + "\n... (truncated)"
-            
-            # Send SMS
-            self.twilio_client.messages.create(
-                body=message,
-                from_=self.twilio_phone,
-                to=self.doctor_phone
-            )
+            raw = await self._call_tool(self.model, system, tool, content, max_tokens, on_partial)
+            return schema.validate_python(raw)
+        except ValidationError:
+            retry_tokens = max_tokens
+        except _TruncatedResponse:
+            # The fallback model is wordier, so give it room to finish
+            retry_tokens = min(max(2 * max_tokens, RETRY_MIN_TOKENS), FALLBACK_MAX_TOKENS)
+        raw = await self._call_tool(self.fallback_model, system, tool, content, retry_tokens, on_partial)
+        return schema.validate_python(raw)
+
+    async def _call_tool(
+        self,
+        model: str,
+        system: List[Dict[str, Any]],
+        tool: Dict[str, Any],
+        content: str,
+        max_tokens: int,
+        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Force a single tool call on the given model and return its input.
+
+        The response is streamed; on_partial, if given, receives the partially
+        parsed tool input as it arrives.
+        """
+        # Stream response from Claude
+        async with self.client.messages.stream(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=0,
+            system=system,
+            tools=[tool],
+            tool_choice={"type": "tool", "name": tool["name"]},
+            messages=[
+                {"role": "user", "content": content}
+            ]
+        ) as stream:
+            async for event in stream:
+                if event.type == "input_json" and on_partial is not None:
+                    on_partial(event.snapshot)
+            response = await stream.get_final_message()
+        # Prompt caching only engages once the cached prefix reaches the model's
+        # minimum cacheable length, so surface whether it actually hit
+        usage = response.usage
+        logger.debug(
+            "%s %s: cache_read=%s cache_write=%s input=%s output=%s",
+            model,
+            tool["name"],
+            getattr(usage, "cache_read_input_tokens", None),
+            getattr(usage, "cache_creation_input_tokens", None),
+            usage.input_tokens,
+            usage.output_tokens,
+        )
+        # The stream parses tool input leniently and drops a half-written
+        # trailing value, so a cut-off input can still validate with items missing
+        if response.stop_reason == "max_tokens":
+            raise _TruncatedResponse(f"{model} {tool['name']} stopped at max_tokens={max_tokens}")
+        return _tool_input(response)
+
+    async def _notify_doctor(
+        self, key: str, structured_data: Dict[str, Any], risk_assessment: Dict[str, Any]
+    ) -> None:
+        """Queue an SMS notification to the doctor for a high-risk case, keyed by its request."""
+        if not _claim_notification(key):
+            logger.debug("Skipping duplicate SMS notification")
+            return
+        message = _format_sms(structured_data, risk_assessment)
+
+        # The queue belongs to the event loop it was created on
+        loop = asyncio.get_running_loop()
+        if self._sms_worker is None or self._sms_worker.done() or self._sms_worker.get_loop() is not loop:
+            self._sms_queue = asyncio.Queue()
+            self._sms_worker = loop.create_task(self._run_sms_worker(self._sms_queue))
+        self._sms_queue.put_nowait((key, message))
+
+    async def flush_notifications(self) -> None:
+        """Wait until every queued doctor alert has been sent.
+
+        Lambda freezes the process once the response is returned, so requests
+        that raise an alert run this as a background task, which Mangum awaits.
+        """
+        pending = [task for task in _background_tasks if not task.done()]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self._sms_worker is not None and not self._sms_worker.done():
+            await self._sms_queue.join()
+
+    async def _run_sms_worker(self, queue: "asyncio.Queue[Tuple[str, str]]") -> None:
+        """Send queued alerts, merging alerts from a burst into as few SMS as possible."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+
+            # A lone alert goes out at once; a second one arriving quickly
+            # means a burst, so keep collecting for the rest of the window
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), SMS_BURST_SECONDS))
+                deadline = loop.time() + SMS_BATCH_WINDOW_SECONDS
+                while (remaining := deadline - loop.time()) > 0:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                for keys, body in _merge_sms(batch):
+                    await self._send_sms(keys, body)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _send_sms(self, keys: List[str], body: str) -> None:
+        """Send one SMS to the doctor."""
+        try:
+            # Send SMS off the event loop; the Twilio client is blocking
+            await asyncio.to_thread(self._create_message, body)
         except Exception as e:
-            print(f"Failed to send SMS notification: {str(e)}")
+            # Release the claims so a retry can send them
+            for key in keys:
+                _recent_notifications.pop(key, None)
+            logger.warning("Failed to send SMS notification: %s", e)
             # Don't raise the exception - we don't want SMS failure to break the main flow
 
+    def _create_message(self, body: str) -> None:
+        """Send the SMS through Twilio, loading the client on first use."""
+        if self.twilio_client is None:
+            self.twilio_client = _twilio_client(*self._twilio_credentials)
+        self.twilio_client.messages.create(
+            body=body,
+            from_=self.twilio_phone,
+            to=self.doctor_phone
+        )
+
+# Only the per-case fields are filled in on each monitor_case call
+_MONITOR_PROMPT: Final[str] = """You are an autonomous medical follow-up agent. Your task is to:
+1. Analyze the initial assessment: {initial_assessment}
+2. Consider similar historical cases: {similar_cases}
+3. Determine if follow-up is needed based on risk level and symptoms
+4. Generate appropriate follow-up questions
+5. Suggest next steps based on the case progression
+6. Identify potential complications based on patterns
+
+Current case ID: {case_id}
+Current time: {now}
+
+Provide a structured response with:
+- Follow-up needed (boolean)
+- Risk level change (if any)
+- Recommended questions
+- Suggested next steps
+- Escalation needed (boolean)
+- Potential complications
+- Recommended preventive measures"""
+
+# Fixed order of the vital signs compared between cases
+VitalVector = Tuple[Optional[float], ...]
+_VITAL_FIELDS = (
+    ("blood_pressure", "systolic"),
+    ("blood_pressure", "diastolic"),
+    ("heart_rate", None),
+    ("temperature", "value"),
+    ("oxygen_saturation", None),
+)
+
+def _vitals_vector(vital_signs: Dict[str, Any]) -> VitalVector:
+    """Flatten vital signs into _VITAL_FIELDS order; missing or non-positive readings are None."""
+    vector = []
+    for field, subfield in _VITAL_FIELDS:
+        value = vital_signs.get(field)
+        if subfield is not None:
+            value = value.get(subfield) if isinstance(value, dict) else None
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+            vector.append(float(value))
+        else:
+            vector.append(None)
+    return tuple(vector)
+
 class FollowUpAgent:
     def __init__(self, anthropic_api_key: str):
         self.anthropic_api_key = anthropic_api_key
         self.conversation_history = {}
         self.learning_history = {}  # Track successful interventions
         self.pattern_recognition = {}  # Track symptom patterns
+        self.case_profiles = {}  # Latest assessment per case, for similarity search
+        self._symptom_index = defaultdict(set)  # Symptom description -> case IDs
+        self._symptom_bits: Dict[str, int] = {}  # Symptom description -> bit in a symptom mask
+        self._case_symptom_counts = defaultdict(Counter)  # Running symptom counts per case
+        self._case_intervention_counts = defaultdict(Counter)  # Running intervention counts per case
         
     async def monitor_case(self, case_id: str, initial_assessment: Dict[str, Any]) -> Dict[str, Any]:
         """Monitor a medical case and provide autonomous follow-up."""
@@ -184,27 +786,12 @@ class FollowUpAgent:
         similar_cases = self._find_similar_cases(initial_assessment)
         
         # Generate context-aware prompt
-        prompt = f"""
-        You are an autonomous medical follow-up agent. Your task is to:
-        1. Analyze the initial assessment: {json.dumps(initial_assessment)}
-        2. Consider similar historical cases: {json.dumps(similar_cases)}
-        3. Determine if follow-up is needed based on risk level and symptoms
-        4. Generate appropriate follow-up questions
-        5. Suggest next steps based on the case progression
-        6. Identify potential complications based on patterns
-        
-        Current case ID: {case_id}
-        Current time: {datetime.now().isoformat()}
-        
-        Provide a structured response with:
-        - Follow-up needed (boolean)
-        - Risk level change (if any)
-        - Recommended questions
-        - Suggested next steps
-        - Escalation needed (boolean)
-        - Potential complications
-        - Recommended preventive measures
-        """
+        prompt = _MONITOR_PROMPT.format_map({
+            "initial_assessment": orjson.dumps(initial_assessment).decode(),
+            "similar_cases": orjson.dumps(similar_cases).decode(),
+            "case_id": case_id,
+            "now": datetime.now().isoformat(),
+        })
         
         # Here you would make the actual API call to Claude
         # For now, returning a mock response
@@ -239,9 +826,19 @@ class FollowUpAgent:
     
     def _find_similar_cases(self, current_case: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Find similar historical cases for pattern recognition."""
+        # A symptom similarity above 0.5 needs at least one shared symptom, so
+        # only cases indexed under one of the current symptoms can match
+        current_symptoms = frozenset(s["description"] for s in current_case.get("symptoms", []))
+        current_mask = self._symptom_mask(current_symptoms)
+        current_vitals = _vitals_vector(current_case.get("vital_signs", {}))
+        candidates = set()
+        for symptom in current_symptoms:
+            candidates.update(self._symptom_index.get(symptom, ()))
+
         similar_cases = []
-        for case_id, history in self.conversation_history.items():
-            if self._is_similar_case(history, current_case):
+        for case_id in candidates:
+            history = self.case_profiles[case_id]
+            if self._is_similar_case(history, current_mask, current_vitals):
                 similar_cases.append({
                     "case_id": case_id,
                     "outcome": history.get("outcome", "unknown"),
@@ -249,36 +846,32 @@ class FollowUpAgent:
                 })
         return similar_cases
     
-    def _is_similar_case(self, history: Dict[str, Any], current_case: Dict[str, Any]) -> bool:
+    def _is_similar_case(self, history: Dict[str, Any], current_mask: int, current_vitals: VitalVector) -> bool:
         """Determine if a historical case is similar to the current case."""
-        # Compare symptoms
-        current_symptoms = set(s["description"] for s in current_case.get("symptoms", []))
-        historical_symptoms = set(s["description"] for s in history.get("symptoms", []))
+        # Symptom masks and vital vectors are precomputed when the case is indexed
+        historical_mask = history["symptom_mask"]
+        historical_vitals = history["vital_vector"]
         
-        # Compare vital signs
-        current_vitals = current_case.get("vital_signs", {})
-        historical_vitals = history.get("vital_signs", {})
-        
-        # Calculate similarity score
-        symptom_similarity = len(current_symptoms.intersection(historical_symptoms)) / len(current_symptoms.union(historical_symptoms))
+        # Calculate similarity score; int.bit_count needs Python 3.10, Lambda runs 3.9
+        symptom_similarity = bin(current_mask & historical_mask).count("1") / bin(current_mask | historical_mask).count("1")
         vital_similarity = self._compare_vital_signs(current_vitals, historical_vitals)
         
         return (symptom_similarity > 0.5) and (vital_similarity > 0.7)
     
-    def _compare_vital_signs(self, current: Dict[str, Any], historical: Dict[str, Any]) -> float:
+    def _symptom_mask(self, symptoms: FrozenSet[str]) -> int:
+        """Encode a set of symptoms as a bitmask, assigning new symptoms the next free bit."""
+        mask = 0
+        for symptom in symptoms:
+            mask |= 1 << self._symptom_bits.setdefault(symptom, len(self._symptom_bits))
+        return mask
+    
+    def _compare_vital_signs(self, current: VitalVector, historical: VitalVector) -> float:
         """Compare vital signs and return similarity score."""
-        if not current or not historical:
-            return 0.0
-            
-        differences = []
-        for key in current:
-            if key in historical:
-                current_val = current[key]
-                historical_val = historical[key]
-                if isinstance(current_val, (int, float)) and isinstance(historical_val, (int, float)):
-                    diff = abs(current_val - historical_val) / max(current_val, historical_val)
-                    differences.append(1 - diff)
-        
+        differences = [
+            1 - abs(c - h) / max(c, h)
+            for c, h in zip(current, historical)
+            if c is not None and h is not None
+        ]
         return sum(differences) / len(differences) if differences else 0.0
     
     def _update_learning_history(self, case_id: str, assessment: Dict[str, Any], response: Dict[str, Any]):
@@ -295,6 +888,25 @@ class FollowUpAgent:
         
         # Update pattern recognition
         self._update_pattern_recognition(assessment, response)
+        self._index_case(case_id, assessment, response)
+
+    def _index_case(self, case_id: str, assessment: Dict[str, Any], response: Dict[str, Any]):
+        """Store the case's latest assessment and index it by symptom for similarity search."""
+        previous = self.case_profiles.get(case_id)
+        if previous is not None:
+            for symptom in previous["symptom_set"]:
+                self._symptom_index[symptom].discard(case_id)
+
+        symptoms = frozenset(s["description"] for s in assessment.get("symptoms", []))
+        self.case_profiles[case_id] = {
+            "symptom_set": symptoms,
+            "symptom_mask": self._symptom_mask(symptoms),
+            "vital_vector": _vitals_vector(assessment.get("vital_signs", {})),
+            "outcome": "pending",
+            "successful_interventions": response.get("successful_interventions", [])
+        }
+        for symptom in symptoms:
+            self._symptom_index[symptom].add(case_id)
     
     def _update_pattern_recognition(self, assessment: Dict[str, Any], response: Dict[str, Any]):
         """Update pattern recognition with new case data."""
@@ -321,6 +933,23 @@ class FollowUpAgent:
                     response["potential_complications"]
                 )
     
+    async def update_conversation_history(self, case_id: str, interaction: Dict[str, Any]):
+        """Record a new interaction for a case and update its running pattern counts."""
+        # Keep counts incrementally so summaries don't recount the whole history.
+        # Count first, so a malformed interaction isn't left half-recorded.
+        symptoms = [s["description"] if isinstance(s, dict) else s for s in interaction.get("symptoms", [])]
+        self._case_symptom_counts[case_id].update(symptoms)
+        self._case_intervention_counts[case_id].update(interaction.get("interventions", []))
+
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "interaction": interaction
+        }
+        for key in ("symptoms", "interventions", "risk_level", "triggering_factors"):
+            if key in interaction:
+                entry[key] = interaction[key]
+        self.conversation_history.setdefault(case_id, []).append(entry)
+
     async def get_case_summary(self, case_id: str) -> Dict[str, Any]:
         """Generate a comprehensive case summary."""
         if case_id not in self.conversation_history:
@@ -360,25 +989,14 @@ class FollowUpAgent:
             return {}
             
         history = self.conversation_history[case_id]
-        symptoms = []
-        interventions = []
-        
-        for entry in history:
-            if "symptoms" in entry:
-                symptoms.extend(entry["symptoms"])
-            if "interventions" in entry:
-                interventions.extend(entry["interventions"])
-        
         return {
-            "common_symptoms": self._get_common_items(symptoms),
-            "successful_interventions": self._get_common_items(interventions),
+            "common_symptoms": self._get_common_items(self._case_symptom_counts[case_id]),
+            "successful_interventions": self._get_common_items(self._case_intervention_counts[case_id]),
             "risk_patterns": self._analyze_risk_patterns(history)
         }
     
-    def _get_common_items(self, items: List[str]) -> List[Dict[str, Any]]:
-        """Get most common items from a list."""
-        from collections import Counter
-        counter = Counter(items)
+    def _get_common_items(self, counter: Counter) -> List[Dict[str, Any]]:
+        """Get the most common items from a running count."""
         return [{"item": item, "count": count} for item, count in counter.most_common(5)]
     
     def _analyze_risk_patterns(self, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -417,22 +1035,23 @@ class CaseMonitor:
 
     async def start_monitoring(self, case_id: str, initial_data: Dict[str, Any]):
         """Start monitoring a new case."""
+        now = datetime.now()
         self.active_cases[case_id] = {
             "data": initial_data,
             "risk_level": initial_data.get("risk_level", "LOW"),
-            "last_check": datetime.now(),
+            "last_check": now,
             "risk_increases": 0,
             "follow_ups_today": 0,
-            "last_follow_up": None,
+            "last_follow_up": None,  # time.monotonic() of the last follow-up
             "alerts": []
         }
-        return await self._schedule_next_check(case_id)
+        return await self._schedule_next_check(case_id, now)
 
-    async def _schedule_next_check(self, case_id: str):
+    async def _schedule_next_check(self, case_id: str, now: datetime):
         """Schedule the next check based on risk level."""
         case = self.active_cases[case_id]
         interval = self.monitoring_rules[case["risk_level"]]["check_interval"]
-        next_check = datetime.now() + timedelta(minutes=interval)
+        next_check = now + timedelta(minutes=interval)
         case["next_check"] = next_check
         return next_check
 
@@ -442,31 +1061,34 @@ class CaseMonitor:
             return {"error": "Case not found"}
 
         case = self.active_cases[case_id]
+        # Read the clock once per check; intervals use the monotonic clock
         current_time = datetime.now()
+        current_iso = current_time.isoformat()
+        current_mono = time.monotonic()
 
         # Check if it's time for a follow-up
-        if self._needs_follow_up(case):
-            follow_up_result = await self._perform_follow_up(case_id)
-            case["last_follow_up"] = current_time
+        if self._needs_follow_up(case, current_mono):
+            follow_up_result = await self._perform_follow_up(case_id, current_iso)
+            case["last_follow_up"] = current_mono
             case["follow_ups_today"] += 1
 
         # Check for risk level changes
-        risk_assessment = await self._assess_current_risk(case_id)
+        risk_assessment = await self._assess_current_risk(case_id, current_iso)
         if risk_assessment["risk_level"] > case["risk_level"]:
             case["risk_increases"] += 1
             case["alerts"].append({
-                "timestamp": current_time.isoformat(),
+                "timestamp": current_iso,
                 "type": "risk_increase",
                 "details": f"Risk level increased to {risk_assessment['risk_level']}"
             })
 
         # Check if escalation is needed
         if self._needs_escalation(case):
-            await self._escalate_case(case_id)
+            await self._escalate_case(case_id, current_iso)
 
         # Update case data
         case["last_check"] = current_time
-        await self._schedule_next_check(case_id)
+        next_check = await self._schedule_next_check(case_id, current_time)
 
         return {
             "case_id": case_id,
@@ -474,41 +1096,40 @@ class CaseMonitor:
                 "risk_level": case["risk_level"],
                 "follow_ups_today": case["follow_ups_today"],
                 "risk_increases": case["risk_increases"],
-                "last_check": case["last_check"].isoformat(),
-                "next_check": case["next_check"].isoformat()
+                "last_check": current_iso,
+                "next_check": next_check.isoformat()
             },
             "alerts": case["alerts"]
         }
 
-    def _needs_follow_up(self, case: Dict[str, Any]) -> bool:
+    def _needs_follow_up(self, case: Dict[str, Any], now_mono: float) -> bool:
         """Determine if a follow-up is needed based on monitoring rules."""
         rules = self.monitoring_rules[case["risk_level"]]
         if case["follow_ups_today"] >= rules["required_follow_ups"]:
             return False
-        if not case["last_follow_up"]:
+        if case["last_follow_up"] is None:
             return True
-        time_since_last = datetime.now() - case["last_follow_up"]
-        return time_since_last.total_seconds() >= 3600  # 1 hour minimum between follow-ups
+        return now_mono - case["last_follow_up"] >= 3600  # 1 hour minimum between follow-ups
 
-    async def _perform_follow_up(self, case_id: str) -> Dict[str, Any]:
+    async def _perform_follow_up(self, case_id: str, timestamp: str) -> Dict[str, Any]:
         """Perform a follow-up check on the case."""
         case = self.active_cases[case_id]
         # Here you would implement the actual follow-up logic
         # For now, returning a mock response
         return {
             "status": "follow_up_completed",
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": timestamp,
             "findings": "No significant changes in condition"
         }
 
-    async def _assess_current_risk(self, case_id: str) -> Dict[str, Any]:
+    async def _assess_current_risk(self, case_id: str, timestamp: str) -> Dict[str, Any]:
         """Assess the current risk level of the case."""
         case = self.active_cases[case_id]
         # Here you would implement the actual risk assessment logic
         # For now, returning a mock response
         return {
             "risk_level": case["risk_level"],
-            "assessment_time": datetime.now().isoformat()
+            "assessment_time": timestamp
         }
 
     def _needs_escalation(self, case: Dict[str, Any]) -> bool:
@@ -516,11 +1137,11 @@ class CaseMonitor:
         rules = self.monitoring_rules[case["risk_level"]]
         return case["risk_increases"] >= rules["escalation_threshold"]
 
-    async def _escalate_case(self, case_id: str):
+    async def _escalate_case(self, case_id: str, timestamp: str):
         """Escalate the case to a higher level of care."""
         case = self.active_cases[case_id]
         case["alerts"].append({
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": timestamp,
             "type": "escalation",
             "details": "Case escalated due to multiple risk increases"
         })
@@ -1,7 +1,22 @@
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 import PyPDF2
+import pypdfium2 as pdfium
 from docx import Document
 import io
+import codecs
+import hashlib
+import asyncio
+import threading
+from collections import OrderedDict
+
+# PDFium is not thread-safe, and parsing now runs on worker threads
+_PDFIUM_LOCK = threading.Lock()
+
+# Read size for decoding text uploads
+TXT_CHUNK_SIZE = 1024 * 1024
+
+# Parsed text of recent PDF/DOCX uploads, keyed by a hash of the file bytes
+PARSED_CACHE_SIZE = 128
 
 class DocumentProcessor:
     def __init__(self):
@@ -10,19 +25,35 @@ class DocumentProcessor:
             'application/vnd.openxmlformats-officedocument.wordprocessingml.document': self._process_docx,
             'text/plain': self._process_txt
         }
+        self._parsed_cache: "OrderedDict[str, str]" = OrderedDict()
 
     async def process_file(self, file) -> str:
         """Process uploaded file and extract text content."""
         try:
-            content = await file.read()
             content_type = file.content_type
             
             if content_type not in self.supported_formats:
                 raise ValueError(f"Unsupported file format: {content_type}")
             
-            # Process the file based on its type
-            text_content = self.supported_formats[content_type](content)
+            # Text is decoded as it is read, so the raw bytes are never held whole
+            if content_type == 'text/plain':
+                return await self._read_txt(file)
             
+            content = await file.read()
+            
+            # A re-uploaded document skips parsing; its triage is cached by text
+            key = f"{content_type}:{hashlib.sha256(content).hexdigest()}"
+            text_content = self._parsed_cache.get(key)
+            if text_content is not None:
+                self._parsed_cache.move_to_end(key)
+                return text_content
+            
+            # Parse in a worker thread so large files don't block the event loop
+            text_content = await asyncio.to_thread(self.supported_formats[content_type], content)
+            
+            self._parsed_cache[key] = text_content
+            if len(self._parsed_cache) > PARSED_CACHE_SIZE:
+                self._parsed_cache.popitem(last=False)
             return text_content
         except Exception as e:
             raise Exception(f"Error processing file: {str(e)}")
@@ -30,31 +61,60 @@ class DocumentProcessor:
     def _process_pdf(self, content: bytes) -> str:
         """Extract text from PDF file."""
         try:
-            pdf_file = io.BytesIO(content)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            
-            return text
+            try:
+                return self._extract_pdf_text_pdfium(content)
+            except pdfium.PdfiumError:
+                # PDFium can reject malformed files that PyPDF2 still reads
+                return self._extract_pdf_text_pypdf2(content)
         except Exception as e:
             raise Exception(f"Error processing PDF: {str(e)}")
 
+    def _extract_pdf_text_pdfium(self, content: bytes) -> str:
+        """Extract text with PDFium (C++), which is much faster than PyPDF2."""
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(content)
+            try:
+                return "\n".join(self._pdfium_page_texts(pdf))
+            finally:
+                pdf.close()
+
+    def _pdfium_page_texts(self, pdf: "pdfium.PdfDocument") -> Iterator[str]:
+        """Yield the text of each page, closing pages as soon as they are read."""
+        for page in pdf:
+            textpage = page.get_textpage()
+            try:
+                yield textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+
+    def _extract_pdf_text_pypdf2(self, content: bytes) -> str:
+        """Extract text with pure-Python PyPDF2."""
+        pdf_file = io.BytesIO(content)
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        return "\n".join((page.extract_text() or "") for page in pdf_reader.pages)
+
     def _process_docx(self, content: bytes) -> str:
         """Extract text from DOCX file."""
         try:
             docx_file = io.BytesIO(content)
             doc = Document(docx_file)
-            text = ""
-            
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            
-            return text
+            return "\n".join(paragraph.text for paragraph in doc.paragraphs)
         except Exception as e:
             raise Exception(f"Error processing DOCX: {str(e)}")
 
+    async def _read_txt(self, file) -> str:
+        """Decode an uploaded TXT file chunk by chunk."""
+        try:
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            buffer = io.StringIO()
+            while chunk := await file.read(TXT_CHUNK_SIZE):
+                buffer.write(decoder.decode(chunk))
+            buffer.write(decoder.decode(b"", final=True))
+            return buffer.getvalue()
+        except Exception as e:
+            raise Exception(f"Error processing TXT: {str(e)}")
+
     def _process_txt(self, content: bytes) -> str:
         """Extract text from TXT file."""
         try:
@@ -1,17 +1,37 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import BackgroundTasks, FastAPI, UploadFile, File, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-import json
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import AsyncIterator, List, Dict, Any, Optional
+import orjson
+import asyncio
 from document_processor import DocumentProcessor
-from agentkit_integration import AgentKitIntegration, StructuredData, FollowUpAgent
+from agentkit_integration import AgentKitIntegration, FollowUpAgent, EXTRACT_BATCH_SIZE
 from triage_pipeline import TriagePipeline
-from pdf_generator import PDFGenerator
+import report_worker
 import os
-import traceback
-from twilio.rest import Client
+import logging
+import sys
+import time
+import httpx
+from anyio import to_thread
 from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    stream=sys.stderr
+)
+logger = logging.getLogger(__name__)
+# httpx logs every request at INFO, including each Twilio call
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Lambda sets this; there the app's startup and shutdown hooks run around
+# every invocation rather than once per process
+ON_LAMBDA = bool(os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
 
 app = FastAPI(
     title="MedAssist AI",
@@ -31,25 +51,151 @@ app.add_middleware(
 # Initialize components
 document_processor = DocumentProcessor()
 agent_kit = AgentKitIntegration()
-triage_pipeline = TriagePipeline()
-pdf_generator = PDFGenerator()
+triage_pipeline = TriagePipeline(agent_kit)
 case_monitor = FollowUpAgent(os.getenv("ANTHROPIC_API_KEY"))
 
 # Initialize Twilio client
-print("Initializing Twilio client...")
+logger.info("Initializing Twilio client...")
 twilio_account_sid = os.getenv("TWILIO_ACCOUNT_SID")
 twilio_auth_token = os.getenv("TWILIO_AUTH_TOKEN")
 twilio_phone_number = os.getenv("TWILIO_PHONE_NUMBER")
 doctor_phone_number = os.getenv("DOCTOR_PHONE_NUMBER")
 
-if not all([twilio_account_sid, twilio_auth_token, twilio_phone_number, doctor_phone_number]):
-    print("WARNING: Missing Twilio credentials. Calls will not be made.")
-    twilio_client = None
+twilio_enabled = all([twilio_account_sid, twilio_auth_token, twilio_phone_number, doctor_phone_number])
+if not twilio_enabled:
+    logger.warning("Missing Twilio credentials. Calls will not be made.")
 else:
-    twilio_client = Client(twilio_account_sid, twilio_auth_token)
-    print("Twilio client initialized successfully.")
+    logger.info("Twilio calls enabled.")
+
+_twilio_http: Optional[httpx.AsyncClient] = None
+
+def get_twilio_http() -> httpx.AsyncClient:
+    """Return the shared Twilio HTTP client, opening a new one if the last was closed."""
+    global _twilio_http
+    if _twilio_http is None or _twilio_http.is_closed:
+        # Call Twilio's REST API directly; the SDK's blocking requests session
+        # would stall the event loop, and one shared client keeps the connection warm
+        _twilio_http = httpx.AsyncClient(
+            http2=True,
+            auth=(twilio_account_sid, twilio_auth_token),
+            base_url=f"https://api.twilio.com/2010-04-01/Accounts/{twilio_account_sid}",
+            timeout=5.0
+        )
+    return _twilio_http
+
+@app.on_event("shutdown")
+async def close_twilio_http():
+    # On Lambda shutdown runs after every invocation; keep the connection warm
+    if _twilio_http is not None and not ON_LAMBDA:
+        await _twilio_http.aclose()
+
+async def call_doctor():
+    """Place the HIGH-risk voice call to the doctor."""
+    try:
+        response = await get_twilio_http().post("/Calls.json", data={
+            "To": doctor_phone_number,
+            "From": twilio_phone_number,
+            "Url": "http://demo.twilio.com/docs/voice.xml"
+        })
+        response.raise_for_status()
+    except Exception as e:
+        logger.warning("Error triggering Twilio call: %s", e)
+
+# Threads shared by sync endpoints and background tasks; anyio's default of 40
+# lets a burst of report downloads queue behind each other
+THREADPOOL_SIZE = 100
+
+@app.on_event("startup")
+async def configure_threadpool():
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+# ReportLab layout is CPU-bound, so reports are built in worker processes
+# that don't share the GIL. Lambda has no /dev/shm for multiprocessing, so
+# there the work falls back to threads.
+PDF_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+@lru_cache(maxsize=None)
+def get_pdf_pool() -> Executor:
+    if ON_LAMBDA:
+        return ThreadPoolExecutor(max_workers=PDF_WORKERS)
+    # Spawn rather than fork: the server process already runs threads
+    return ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+async def save_report(result: Dict[str, Any]) -> str:
+    """Build and save the PDF report in the worker pool."""
+    return await asyncio.get_running_loop().run_in_executor(get_pdf_pool(), report_worker.save_report, result)
+
+async def warm_up():
+    """Open connections and start PDF workers so the first request doesn't pay for it."""
+    loop = asyncio.get_running_loop()
+    pdf_pool = get_pdf_pool()
+    tasks = [agent_kit.warm_up()]
+    tasks += [loop.run_in_executor(pdf_pool, report_worker.warm_up) for _ in range(PDF_WORKERS)]
+    if twilio_enabled:
+        tasks.append(get_twilio_http().get(f"https://api.twilio.com/2010-04-01/Accounts/{twilio_account_sid}.json"))
+
+    for result in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(result, Exception):
+            logger.warning("Warm-up step failed: %s", result)
+
+# Saved reports are kept for a day; reusing a cached report refreshes its age
+REPORT_MAX_AGE_SECONDS = 24 * 3600
+REPORT_GC_INTERVAL_SECONDS = 3600
+# Reports hold patient data, so only the requesting browser may cache them,
+# and for no longer than the report is kept
+REPORT_CACHE_CONTROL = f"private, max-age={REPORT_MAX_AGE_SECONDS}"
+
+def prune_reports() -> int:
+    """Delete reports older than REPORT_MAX_AGE_SECONDS and return how many were removed."""
+    cutoff = time.time() - REPORT_MAX_AGE_SECONDS
+    removed = 0
+    with os.scandir("reports") as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass  # Already removed by another worker
+    return removed
 
-# Create reports directory
+async def gc_reports():
+    """Prune old reports every REPORT_GC_INTERVAL_SECONDS."""
+    while True:
+        try:
+            removed = await asyncio.to_thread(prune_reports)
+            if removed:
+                logger.info("Pruned %d old reports", removed)
+        except Exception:
+            logger.exception("Error pruning reports")
+        await asyncio.sleep(REPORT_GC_INTERVAL_SECONDS)
+
+# Long-running tasks started with the app and cancelled on shutdown
+_app_tasks: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # On Lambda these would rerun on every request and be cancelled before
+    # finishing; warming up would also load ReportLab during the cold start
+    if ON_LAMBDA:
+        return
+    # Warm-up runs in the background so a slow dependency can't hold up startup
+    _app_tasks.append(asyncio.ensure_future(warm_up()))
+    _app_tasks.append(asyncio.ensure_future(gc_reports()))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in _app_tasks:
+        task.cancel()
+    _app_tasks.clear()
+    # On Lambda shutdown runs after every invocation, so the pool is kept
+    if get_pdf_pool.cache_info().currsize and not ON_LAMBDA:
+        get_pdf_pool().shutdown(wait=False)
+        # A later startup in the same process gets a fresh pool
+        get_pdf_pool.cache_clear()
+
+# Create reports directory once at import; PDFGenerator and its pool workers
+# rely on it existing
 os.makedirs("reports", exist_ok=True)
 
 class StructuredData(BaseModel):
@@ -60,118 +206,177 @@ class StructuredData(BaseModel):
 class TriageRequest(BaseModel):
     text: str
 
+# Up to four Claude calls per batch request
+BATCH_MAX_TEXTS = 4 * EXTRACT_BATCH_SIZE
+
+class BatchExtractRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, max_length=BATCH_MAX_TEXTS)
+
 @app.post("/api/analyze-triage")
-async def analyze_triage(data: StructuredData):
+async def analyze_triage(
+    data: StructuredData, background: BackgroundTasks, idempotency_key: Optional[str] = Header(None)
+) -> Dict[str, Any]:
     try:
-        result = triage_pipeline.process(data.dict())
-        pdf_path = pdf_generator.save_report(result)
+        result = await triage_pipeline.process(data.model_dump(), idempotency_key)
+        if result["risk_assessment"].get("risk_level") == "HIGH":
+            # Send the doctor's SMS before the request ends; Lambda freezes after it
+            background.add_task(agent_kit.flush_notifications)
+
+        pdf_path = await save_report(result)
         result["pdf_url"] = f"/api/reports/{os.path.basename(pdf_path)}"
         return result
     except Exception as e:
-        print("Error in /api/analyze-triage:")
-        traceback.print_exc()
+        logger.exception("Error in /api/analyze-triage")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/analyze-document")
-async def analyze_document(file: UploadFile = File(...)):
+async def analyze_document(
+    background: BackgroundTasks, file: UploadFile = File(...), idempotency_key: Optional[str] = Header(None)
+) -> Dict[str, Any]:
     try:
         content = await document_processor.process_file(file)
-        structured_data = agent_kit.extract_structured_data(content)
-        risk_assessment = agent_kit.analyze_risk(structured_data)
+        result = await agent_kit.triage(content, idempotency_key=idempotency_key)
+        risk_assessment = result["risk_assessment"]
         
-        if risk_assessment.get("risk_level") == "HIGH" and twilio_client:
-            try:
-                call = twilio_client.calls.create(
-                    to=doctor_phone_number,
-                    from_=twilio_phone_number,
-                    url="http://demo.twilio.com/docs/voice.xml"
-                )
-            except Exception as e:
-                print(f"Error triggering Twilio call: {str(e)}")
-
-        result = triage_pipeline.process(structured_data)
-        pdf_path = pdf_generator.save_report(result)
+        if risk_assessment.get("risk_level") == "HIGH":
+            # Send the doctor's SMS before the request ends; Lambda freezes after it
+            background.add_task(agent_kit.flush_notifications)
+            if twilio_enabled:
+                # Place the call after the response is sent
+                background.add_task(call_doctor)
+
+        pdf_path = await save_report(result)
         result["pdf_url"] = f"/api/reports/{os.path.basename(pdf_path)}"
         return result
     except Exception as e:
-        print("Error in /api/analyze-document:")
-        traceback.print_exc()
+        logger.exception("Error in /api/analyze-document")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Plain def: Starlette runs it on the threadpool, keeping the stat off the event loop
 @app.get("/api/reports/{filename}")
-async def get_report(filename: str):
+def get_report(filename: str):
     try:
         file_path = os.path.join("reports", filename)
-        if not os.path.exists(file_path):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="Report not found")
-        return FileResponse(file_path, media_type="application/pdf")
+        # Hand Starlette the stat so it doesn't stat again
+        return FileResponse(
+            file_path,
+            media_type="application/pdf",
+            filename=filename,
+            stat_result=stat,
+            headers={"Cache-Control": REPORT_CACHE_CONTROL}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        print("Error in /api/reports/{filename}:")
-        traceback.print_exc()
+        logger.exception("Error in /api/reports/{filename}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/health")
-async def health_check():
+async def health_check() -> Dict[str, str]:
     return {"status": "healthy"}
 
 @app.post("/api/analyze")
-async def analyze_triage(request: TriageRequest) -> Dict[str, Any]:
+async def analyze_text(
+    request: TriageRequest, background: BackgroundTasks, idempotency_key: Optional[str] = Header(None)
+) -> Dict[str, Any]:
     try:
-        structured_data = agent_kit.extract_structured_data(request.text)
-        risk_assessment = agent_kit.analyze_risk(structured_data)
+        result = await agent_kit.triage(request.text, idempotency_key=idempotency_key)
+        risk_assessment = result["risk_assessment"]
         
-        if risk_assessment.get("risk_level") == "HIGH" and twilio_client:
-            try:
-                call = twilio_client.calls.create(
-                    to=doctor_phone_number,
-                    from_=twilio_phone_number,
-                    url="http://demo.twilio.com/docs/voice.xml"
-                )
-            except Exception as e:
-                print(f"Error triggering Twilio call: {str(e)}")
+        if risk_assessment.get("risk_level") == "HIGH":
+            # Send the doctor's SMS before the request ends; Lambda freezes after it
+            background.add_task(agent_kit.flush_notifications)
+            if twilio_enabled:
+                # Place the call after the response is sent
+                background.add_task(call_doctor)
         
-        result = {
-            "structured_data": structured_data,
-            "risk_assessment": risk_assessment
-        }
-        pdf_path = pdf_generator.save_report(result)
+        pdf_path = await save_report(result)
         result["pdf_url"] = f"/api/reports/{os.path.basename(pdf_path)}"
         
         return result
     except Exception as e:
-        print(f"Error in analyze_triage: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error in /api/analyze")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/analyze-stream")
+async def analyze_text_stream(
+    request: TriageRequest, background: BackgroundTasks, idempotency_key: Optional[str] = Header(None)
+) -> StreamingResponse:
+    """Triage text input, streaming partial results as newline-delimited JSON."""
+    partials: asyncio.Queue = asyncio.Queue()
+
+    async def events() -> AsyncIterator[str]:
+        task = asyncio.ensure_future(agent_kit.triage(
+            request.text, on_partial=partials.put_nowait, idempotency_key=idempotency_key
+        ))
+        try:
+            # Forward partial results until the triage call finishes
+            while not task.done():
+                getter = asyncio.ensure_future(partials.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield orjson.dumps({"type": "partial", "data": getter.result()}) + b"\n"
+                else:
+                    getter.cancel()
+
+            result = task.result()
+            if result["risk_assessment"].get("risk_level") == "HIGH":
+                # Send the SMS and place the call once the stream has finished
+                background.add_task(agent_kit.flush_notifications)
+                if twilio_enabled:
+                    background.add_task(call_doctor)
+
+            pdf_path = await save_report(result)
+            result["pdf_url"] = f"/api/reports/{os.path.basename(pdf_path)}"
+            yield orjson.dumps({"type": "result", "data": result}) + b"\n"
+        except Exception as e:
+            # Headers are already sent, so report the failure in the stream
+            logger.exception("Error in /api/analyze-stream")
+            yield orjson.dumps({"type": "error", "detail": str(e)}) + b"\n"
+        finally:
+            task.cancel()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson", background=background)
+
+@app.post("/api/extract-batch")
+async def extract_batch(request: BatchExtractRequest) -> List[Dict[str, Any]]:
+    """Extract structured data for a batch of patient texts in as few Claude calls as fit."""
+    try:
+        return await agent_kit.extract_structured_data_batch(request.texts)
+    except Exception as e:
+        logger.exception("Error in extract_batch")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/follow-up/{case_id}")
-async def follow_up_case(case_id: str, assessment: Dict[str, Any]):
+async def follow_up_case(case_id: str, assessment: Dict[str, Any]) -> Dict[str, Any]:
     """Initiate autonomous follow-up for a medical case."""
     try:
         result = await case_monitor.monitor_case(case_id, assessment)
         return result
     except Exception as e:
-        print(f"Error in follow-up: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Error in follow-up")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/case-history/{case_id}")
-async def get_case_history(case_id: str):
+async def get_case_history(case_id: str) -> Dict[str, Any]:
     """Get the conversation history for a case."""
     try:
         history = await case_monitor.get_case_summary(case_id)
         return history
     except Exception as e:
-        print(f"Error getting case history: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Error getting case history")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/update-case/{case_id}")
-async def update_case(case_id: str, interaction: Dict[str, Any]):
+async def update_case(case_id: str, interaction: Dict[str, Any]) -> Dict[str, str]:
     """Update the case with new interaction data."""
     try:
         await case_monitor.update_conversation_history(case_id, interaction)
         return {"status": "success", "message": "Case updated successfully"}
     except Exception as e:
-        print(f"Error updating case: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Error updating case")
         raise HTTPException(status_code=500, detail=str(e))
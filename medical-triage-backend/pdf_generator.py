@@ -1,4 +1,4 @@
-from typing import Dict, Any
+from typing import Dict, Any, BinaryIO, Optional
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
@@ -6,14 +6,48 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 import io
 import os
+import hashlib
+import threading
+import orjson
+from collections import OrderedDict
 from datetime import datetime
 
+# Number of assessments whose saved report path is remembered
+REPORT_CACHE_SIZE = 512
+
+# Table layouts are the same for every report, so build them once
+SYMPTOMS_COL_WIDTHS = (4*inch, 2*inch)
+SYMPTOMS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 12),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+VITALS_COL_WIDTHS = (2*inch, 4*inch)
+VITALS_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), colors.beige),
+    ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 0), (-1, -1), 12),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
 class PDFGenerator:
     def __init__(self):
         self.styles = getSampleStyleSheet()
         self._setup_custom_styles()
-        # Create reports directory if it doesn't exist
-        os.makedirs("reports", exist_ok=True)
+        # Assessment hash -> saved report path; save_report runs on worker threads
+        self._report_paths: "OrderedDict[str, str]" = OrderedDict()
+        self._report_lock = threading.Lock()
 
     def _setup_custom_styles(self):
         self.styles.add(ParagraphStyle(
@@ -37,7 +71,12 @@ class PDFGenerator:
 
     def generate_report(self, data: Dict[str, Any]) -> bytes:
         buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
+        self._build(data, buffer)
+        return buffer.getvalue()
+
+    def _build(self, data: Dict[str, Any], output: BinaryIO) -> None:
+        """Lay out the report and write the PDF to output."""
+        doc = SimpleDocTemplate(output, pagesize=letter)
         story = []
 
         # Title
@@ -52,46 +91,30 @@ class PDFGenerator:
 
         # Symptoms
         story.append(Paragraph("Symptoms", self.styles['CustomHeading']))
-        symptoms_data = [["Description", "Severity"]]
-        for symptom in data['structured_data']['symptoms']:
-            symptoms_data.append([symptom['description'], symptom['severity']])
+        symptoms_data = [
+            ["Description", "Severity"],
+            *([symptom['description'], symptom['severity']] for symptom in data['structured_data']['symptoms'])
+        ]
         
-        symptoms_table = Table(symptoms_data, colWidths=[4*inch, 2*inch])
-        symptoms_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        symptoms_table = Table(symptoms_data, colWidths=SYMPTOMS_COL_WIDTHS)
+        symptoms_table.setStyle(SYMPTOMS_TABLE_STYLE)
         story.append(symptoms_table)
         story.append(Spacer(1, 12))
 
         # Vital Signs
         story.append(Paragraph("Vital Signs", self.styles['CustomHeading']))
         vitals = data['structured_data']['vital_signs']
+        blood_pressure = vitals['blood_pressure']
+        temperature = vitals['temperature']
         vitals_data = [
-            ["Blood Pressure", f"{vitals['blood_pressure']['systolic']}/{vitals['blood_pressure']['diastolic']} mmHg"],
+            ["Blood Pressure", f"{blood_pressure['systolic']}/{blood_pressure['diastolic']} mmHg"],
             ["Heart Rate", f"{vitals['heart_rate']} bpm"],
-            ["Temperature", f"{vitals['temperature']['value']}°{vitals['temperature']['unit']}"],
+            ["Temperature", f"{temperature['value']}°{temperature['unit']}"],
             ["Oxygen Saturation", f"{vitals['oxygen_saturation']}%"]
         ]
         
-        vitals_table = Table(vitals_data, colWidths=[2*inch, 4*inch])
-        vitals_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, -1), colors.beige),
-            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        vitals_table = Table(vitals_data, colWidths=VITALS_COL_WIDTHS)
+        vitals_table.setStyle(VITALS_TABLE_STYLE)
         story.append(vitals_table)
         story.append(Spacer(1, 12))
 
@@ -103,23 +126,58 @@ class PDFGenerator:
 
         # Build PDF
         doc.build(story)
-        return buffer.getvalue()
 
     def save_report(self, data: Dict[str, Any]) -> str:
         """Generate and save the PDF report to a file."""
         try:
-            # Generate PDF content
-            pdf_content = self.generate_report(data)
+            # Reuse the saved report if the same assessment was reported before
+            key = hashlib.blake2b(orjson.dumps(data, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+            with self._report_lock:
+                cached_path = self._report_paths.get(key)
+                if cached_path is not None and os.path.exists(cached_path):
+                    self._report_paths.move_to_end(key)
+                    # Touch the file so the reports cleanup treats it as new
+                    os.utime(cached_path)
+                    return cached_path
             
-            # Create filename with timestamp
+            # Create filename with timestamp; the hash keeps reports saved in the same second apart
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"medical_triage_report_{timestamp}.pdf"
+            filename = f"medical_triage_report_{timestamp}_{key[:8]}.pdf"
             filepath = os.path.join("reports", filename)
             
-            # Save to file
-            with open(filepath, "wb") as f:
-                f.write(pdf_content)
+            # Build straight into a temporary file, then move it into place so
+            # a download never sees a half-written report
+            temp_path = filepath + ".tmp"
+            try:
+                with open(temp_path, "wb") as f:
+                    self._build(data, f)
+                os.replace(temp_path, filepath)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
             
+            with self._report_lock:
+                self._report_paths[key] = filepath
+                if len(self._report_paths) > REPORT_CACHE_SIZE:
+                    self._report_paths.popitem(last=False)
             return filepath
         except Exception as e:
             raise Exception(f"Error saving PDF report: {str(e)}")
+
+# One generator per process, so pool workers keep their styles and report cache
+_process_generator: Optional[PDFGenerator] = None
+
+def _get_generator() -> PDFGenerator:
+    global _process_generator
+    if _process_generator is None:
+        _process_generator = PDFGenerator()
+    return _process_generator
+
+def save_report(data: Dict[str, Any]) -> str:
+    """Save a report with this process's generator; the entry point for worker pools."""
+    return _get_generator().save_report(data)
+
+def warm_up() -> None:
+    """Load ReportLab and build the styles in this worker ahead of the first report."""
+    _get_generator()
@@ -0,0 +1,16 @@
+from typing import Dict, Any
+
+# Entry points handed to the PDF pool. pdf_generator is imported inside each
+# call, so ReportLab only loads where reports are built, never in the server
+# process that submits them. They live outside main so spawned workers don't
+# re-import the app to unpickle them.
+
+def save_report(result: Dict[str, Any]) -> str:
+    """Build and save the PDF report for a triage result."""
+    from pdf_generator import save_report as save_pdf_report
+    return save_pdf_report(result)
+
+def warm_up() -> None:
+    """Load ReportLab and build the worker's generator."""
+    from pdf_generator import warm_up as warm_up_pdf_generator
+    warm_up_pdf_generator()
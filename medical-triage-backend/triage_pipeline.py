@@ -1,14 +1,15 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from agentkit_integration import AgentKitIntegration
 
 class TriagePipeline:
-    def __init__(self):
-        self.agent_kit = AgentKitIntegration()
+    def __init__(self, agent_kit: AgentKitIntegration):
+        # Share the caller's integration rather than building a second one
+        self.agent_kit = agent_kit
 
-    def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
+    async def process(self, data: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
         try:
             # Analyze risk using the structured data
-            risk_assessment = self.agent_kit.analyze_risk(data)
+            risk_assessment = await self.agent_kit.analyze_risk(data, idempotency_key)
             
             # Return the complete result
             return {
@@ -17,23 +18,3 @@ class TriagePipeline:
             }
         except Exception as e:
             raise Exception(f"Error in triage pipeline: {str(e)}")
-
-    def _validate_data(self, data: Dict[str, Any]) -> None:
-        """Validate the input data structure."""
-        required_fields = ["symptoms", "vital_signs", "medical_history"]
-        
-        for field in required_fields:
-            if field not in data:
-                raise ValueError(f"Missing required field: {field}")
-            
-            if not isinstance(data[field], (list, dict)):
-                raise ValueError(f"Invalid type for field {field}")
-            
-            if field == "symptoms" and not isinstance(data[field], list):
-                raise ValueError("Symptoms must be a list")
-            
-            if field == "vital_signs" and not isinstance(data[field], dict):
-                raise ValueError("Vital signs must be a dictionary")
-            
-            if field == "medical_history" and not isinstance(data[field], list):
-                raise ValueError("Medical history must be a list") 
\ No newline at end of file